@@ -1,9 +1,16 @@
 import os
-from datetime import datetime, date
+from datetime import date
 
-from flask import Flask, render_template, request, redirect, url_for, flash
+import click
+from flask import Flask, render_template, request, redirect, url_for, flash, g, abort
+from sqlalchemy.dialects import postgresql, sqlite
 
 from extensions import db
+from schema import configure_sqlite_engine, init_schema, schema_is_current
+
+# Dialect-specific INSERT constructs that support ON CONFLICT upserts, one
+# for each supported database.
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
 
 
 def create_app():
@@ -14,22 +21,109 @@ def create_app():
         "DATABASE_URL", "sqlite:///expenses.db"
     )
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    database_uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    if database_uri.startswith("sqlite:///") and ":memory:" not in database_uri:
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "pool_size": 10,
+            "connect_args": {"check_same_thread": False},
+        }
+    app.config["AUTO_CREATE_DB"] = os.environ.get("AUTO_CREATE_DB") == "1"
+    app.config["TEMPLATES_AUTO_RELOAD"] = os.environ.get("TEMPLATES_AUTO_RELOAD") == "1"
 
     db.init_app(app)
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if dialect not in _UPSERT_INSERTS:
+            raise RuntimeError(
+                f"Unsupported database {dialect!r}; use SQLite or PostgreSQL."
+            )
+        if dialect == "sqlite":
+            configure_sqlite_engine(db.engine)
 
-    from models import User, Category, Budget, Expense  # noqa: F401
+    from models import User, Category, Budget, Expense, MonthlySpend  # noqa: F401
 
-    with app.app_context():
-        db.create_all()
+    @app.cli.command("init-db")
+    def init_db():
+        
+        try:
+            init_schema()
+        except RuntimeError as exc:
+            raise click.ClickException(str(exc)) from exc
+        click.echo("Database initialised.")
+
+    if app.config["AUTO_CREATE_DB"]:
+        with app.app_context():
+            init_schema()
+
+    if _serves_requests():
+        with app.app_context():
+            if not schema_is_current():
+                raise RuntimeError(
+                    "The database schema is missing or out of date; "
+                    "run `flask init-db` first."
+                )
 
     register_routes(app)
 
+    # Compile every template up front so requests hit the Jinja cache.
+    for template_name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template_name)
+
     return app
 
 
+def _serves_requests() -> bool:
+    # The Flask CLI loads the app for every command, init-db included; of
+    # those, only `flask run` goes on to serve requests.
+    ctx = click.get_current_context(silent=True)
+    return ctx is None or ctx.info_name == "run"
+
+
 def register_routes(app: Flask) -> None:
     
-    from models import User, Category, Budget, Expense
+    from models import User, Category, Budget, Expense, MonthlySpend
+
+    def categories_for(user_id: int) -> list:
+        
+        cache = g.setdefault("categories", {})
+        if user_id not in cache:
+            cache[user_id] = Category.query.filter_by(user_id=user_id).all()
+        return cache[user_id]
+
+    def add_month_spend(
+        user_id: int, category_id: int, month: date, amount: float
+    ) -> float:
+        
+        insert = _UPSERT_INSERTS[db.session.get_bind().dialect.name]
+        stmt = insert(MonthlySpend).values(
+            user_id=user_id, category_id=category_id, month=month, total=amount
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "category_id", "month"],
+            set_={"total": MonthlySpend.total + stmt.excluded.total},
+        ).returning(MonthlySpend.total)
+        return db.session.execute(stmt).scalar_one()
+
+    def upsert_budgets(user_id: int, month: date, amounts: dict) -> None:
+        
+        insert = _UPSERT_INSERTS[db.session.get_bind().dialect.name]
+        stmt = insert(Budget)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "category_id", "month"],
+            set_={"amount": stmt.excluded.amount},
+        )
+        db.session.execute(
+            stmt,
+            [
+                {
+                    "user_id": user_id,
+                    "category_id": category_id,
+                    "month": month,
+                    "amount": amount,
+                }
+                for category_id, amount in amounts.items()
+            ],
+        )
 
     @app.route("/")
     def index():
@@ -59,20 +153,15 @@ def register_routes(app: Flask) -> None:
     @app.route("/user/<int:user_id>/dashboard")
     def dashboard(user_id: int):
         
-        user = User.query.get_or_404(user_id)
+        user = db.get_or_404(User, user_id)
         return render_template("dashboard.html", user=user)
 
     @app.route("/user/<int:user_id>/delete", methods=["POST"])
     def delete_user(user_id: int):
         
-        user = User.query.get_or_404(user_id)
-
-        
-        Expense.query.filter_by(user_id=user.id).delete()
-        Budget.query.filter_by(user_id=user.id).delete()
-        Category.query.filter_by(user_id=user.id).delete()
-
-        db.session.delete(user)
+        result = db.session.execute(db.delete(User).where(User.id == user_id))
+        if result.rowcount == 0:
+            abort(404)
         db.session.commit()
 
         flash("User deleted.", "success")
@@ -81,7 +170,7 @@ def register_routes(app: Flask) -> None:
     @app.route("/user/<int:user_id>/categories", methods=["GET", "POST"])
     def manage_categories(user_id: int):
         
-        user = User.query.get_or_404(user_id)
+        user = db.get_or_404(User, user_id)
 
         if request.method == "POST":
             name = request.form.get("name", "").strip()
@@ -95,22 +184,23 @@ def register_routes(app: Flask) -> None:
                     category = Category(name=name, user_id=user.id)
                     db.session.add(category)
                     db.session.commit()
+                    g.pop("categories", None)
                     flash("Category created.", "success")
             return redirect(url_for("manage_categories", user_id=user.id))
 
-        categories = Category.query.filter_by(user_id=user.id).all()
+        categories = categories_for(user.id)
         return render_template("categories.html", user=user, categories=categories)
 
     @app.route("/user/<int:user_id>/budgets", methods=["GET", "POST"])
     def manage_budgets(user_id: int):
         
-        user = User.query.get_or_404(user_id)
-        categories = Category.query.filter_by(user_id=user.id).all()
+        user = db.get_or_404(User, user_id)
+        categories = categories_for(user.id)
 
         selected_month_str = request.args.get("month")
         if selected_month_str:
             try:
-                selected_month = datetime.strptime(selected_month_str, "%Y-%m").date()
+                selected_month = _parse_month(selected_month_str)
             except ValueError:
                 selected_month = date.today().replace(day=1)
         else:
@@ -119,14 +209,16 @@ def register_routes(app: Flask) -> None:
         if request.method == "POST":
             month_str = request.form.get("month")
             try:
-                month = datetime.strptime(month_str, "%Y-%m").date()
+                month = _parse_month(month_str)
             except (TypeError, ValueError):
                 flash("Invalid month format.", "error")
                 return redirect(url_for("manage_budgets", user_id=user.id))
 
+            amounts = {}
+            form_get = request.form.get
+
             for category in categories:
-                field_name = f"budget_{category.id}"
-                raw_value = request.form.get(field_name)
+                raw_value = form_get(f"budget_{category.id}")
                 if raw_value is None or raw_value.strip() == "":
                     continue
 
@@ -138,32 +230,23 @@ def register_routes(app: Flask) -> None:
                     flash(f"Invalid budget amount for {category.name}.", "error")
                     continue
 
-                budget = Budget.query.filter_by(
-                    user_id=user.id, category_id=category.id, month=month
-                ).first()
-
-                if budget:
-                    budget.amount = amount
-                else:
-                    db.session.add(
-                        Budget(
-                            user_id=user.id,
-                            category_id=category.id,
-                            month=month,
-                            amount=amount,
-                        )
-                    )
+                amounts[category.id] = amount
 
+            if amounts:
+                upsert_budgets(user.id, month, amounts)
             db.session.commit()
             flash("Budgets saved.", "success")
             return redirect(
                 url_for("manage_budgets", user_id=user.id, month=month.strftime("%Y-%m"))
             )
 
-        existing_budgets = {
-            b.category_id: b
-            for b in Budget.query.filter_by(user_id=user.id, month=selected_month)
-        }
+        existing_budgets = dict(
+            db.session.execute(
+                db.select(Budget.category_id, Budget.amount).filter_by(
+                    user_id=user.id, month=selected_month
+                )
+            ).all()
+        )
 
         return render_template(
             "budgets.html",
@@ -176,8 +259,8 @@ def register_routes(app: Flask) -> None:
     @app.route("/user/<int:user_id>/expenses/new", methods=["GET", "POST"])
     def create_expense(user_id: int):
         
-        user = User.query.get_or_404(user_id)
-        categories = Category.query.filter_by(user_id=user.id).all()
+        user = db.get_or_404(User, user_id)
+        categories = categories_for(user.id)
 
         if request.method == "POST":
             category_id = request.form.get("category_id")
@@ -194,14 +277,14 @@ def register_routes(app: Flask) -> None:
                 return redirect(url_for("create_expense", user_id=user.id))
 
             try:
-                expense_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+                expense_date = _parse_date(date_str)
             except ValueError:
                 flash("Invalid date.", "error")
                 return redirect(url_for("create_expense", user_id=user.id))
 
-            category = Category.query.filter_by(
-                id=category_id, user_id=user.id
-            ).first()
+            category = next(
+                (c for c in categories if str(c.id) == category_id), None
+            )
             if not category:
                 flash("Invalid category.", "error")
                 return redirect(url_for("create_expense", user_id=user.id))
@@ -214,28 +297,17 @@ def register_routes(app: Flask) -> None:
                 description=description or None,
             )
             db.session.add(expense)
-            db.session.commit()
 
             
             month_start = expense_date.replace(day=1)
+            total_spent = add_month_spend(user.id, category.id, month_start, amount)
+            db.session.commit()
 
             budget = Budget.query.filter_by(
                 user_id=user.id, category_id=category.id, month=month_start
             ).first()
 
             if budget:
-                total_spent = (
-                    db.session.query(db.func.sum(Expense.amount))
-                    .filter(
-                        Expense.user_id == user.id,
-                        Expense.category_id == category.id,
-                        Expense.date >= month_start,
-                        Expense.date < _next_month(month_start),
-                    )
-                    .scalar()
-                    or 0.0
-                )
-
                 remaining = budget.amount - total_spent
 
                 if remaining < 0:
@@ -261,70 +333,66 @@ def register_routes(app: Flask) -> None:
     @app.route("/user/<int:user_id>/expenses")
     def list_expenses(user_id: int):
         
-        user = User.query.get_or_404(user_id)
-        expenses = (
-            Expense.query.filter_by(user_id=user.id)
+        user = db.get_or_404(User, user_id)
+        expenses = db.session.execute(
+            db.select(
+                Expense.id,
+                Expense.date,
+                Expense.amount,
+                Expense.description,
+                Category.name.label("category_name"),
+            )
+            .join(Category, Expense.category_id == Category.id)
+            .filter(Expense.user_id == user.id)
             .order_by(Expense.date.desc())
             .limit(50)
-            .all()
-        )
-        categories = {c.id: c for c in Category.query.filter_by(user_id=user.id).all()}
+        ).all()
         return render_template(
             "expenses.html",
             user=user,
             expenses=expenses,
-            categories=categories,
         )
 
     @app.route("/user/<int:user_id>/reports/monthly")
     def monthly_report(user_id: int):
         
-        user = User.query.get_or_404(user_id)
+        user = db.get_or_404(User, user_id)
 
         month_str = request.args.get("month")
         if month_str:
             try:
-                month_start = datetime.strptime(month_str, "%Y-%m").date()
+                month_start = _parse_month(month_str)
             except ValueError:
                 month_start = date.today().replace(day=1)
         else:
             month_start = date.today().replace(day=1)
 
-        month_end = _next_month(month_start)
-
         
-        total_spent = (
-            db.session.query(db.func.sum(Expense.amount))
-            .filter(
-                Expense.user_id == user.id,
-                Expense.date >= month_start,
-                Expense.date < month_end,
-            )
-            .scalar()
-            or 0.0
+        spent_by_category = dict(
+            db.session.execute(
+                db.select(MonthlySpend.category_id, MonthlySpend.total).filter_by(
+                    user_id=user.id, month=month_start
+                )
+            ).all()
+        )
+        budgets_by_category = dict(
+            db.session.execute(
+                db.select(Budget.category_id, Budget.amount).filter_by(
+                    user_id=user.id, month=month_start
+                )
+            ).all()
         )
+        total_spent = sum(spent_by_category.values(), 0.0)
 
        
-        categories = Category.query.filter_by(user_id=user.id).all()
+        categories = db.session.execute(
+            db.select(Category.id, Category.name).filter_by(user_id=user.id)
+        ).all()
 
         per_category = []
         for category in categories:
-            spent = (
-                db.session.query(db.func.sum(Expense.amount))
-                .filter(
-                    Expense.user_id == user.id,
-                    Expense.category_id == category.id,
-                    Expense.date >= month_start,
-                    Expense.date < month_end,
-                )
-                .scalar()
-                or 0.0
-            )
-
-            budget = Budget.query.filter_by(
-                user_id=user.id, category_id=category.id, month=month_start
-            ).first()
-            budget_amount = budget.amount if budget else 0.0
+            spent = spent_by_category.get(category.id, 0.0)
+            budget_amount = budgets_by_category.get(category.id, 0.0)
             remaining = budget_amount - spent
 
             if remaining < 0:
@@ -353,11 +421,30 @@ def register_routes(app: Flask) -> None:
         )
 
 
-def _next_month(d: date) -> date:
+def _parse_month(value: str) -> date:
+    
+    year, month = value[:4], value[5:7]
+    if len(value) != 7 or value[4] != "-" or not _is_digits(year + month):
+        raise ValueError(f"Invalid month: {value!r}")
+    return date(int(year), int(month), 1)
+
+
+def _parse_date(value: str) -> date:
     
-    if d.month == 12:
-        return date(d.year + 1, 1, 1)
-    return date(d.year, d.month + 1, 1)
+    year, month, day = value[:4], value[5:7], value[8:10]
+    if (
+        len(value) != 10
+        or value[4] != "-"
+        or value[7] != "-"
+        or not _is_digits(year + month + day)
+    ):
+        raise ValueError(f"Invalid date: {value!r}")
+    return date(int(year), int(month), int(day))
+
+
+def _is_digits(value: str) -> bool:
+    # int() also accepts signs, whitespace and underscores; strptime does not.
+    return value.isascii() and value.isdigit()
 
 
 if __name__ == "__main__":
@@ -1,6 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 
 
-db = SQLAlchemy()
-
-
+# No route relies on pending changes being flushed before a query, so
+# skip the autoflush check that every read would otherwise trigger.
+db = SQLAlchemy(session_options={"autoflush": False})
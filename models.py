@@ -12,9 +12,27 @@ class User(db.Model):
     name = db.Column(db.String(120), nullable=False)
     email = db.Column(db.String(255), nullable=True, unique=True)
 
-    categories = db.relationship("Category", backref="user", lazy=True)
-    budgets = db.relationship("Budget", backref="user", lazy=True)
-    expenses = db.relationship("Expense", backref="user", lazy=True)
+    categories = db.relationship(
+        "Category",
+        backref=db.backref("user", lazy="raise"),
+        lazy="raise",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    budgets = db.relationship(
+        "Budget",
+        backref=db.backref("user", lazy="raise"),
+        lazy="raise",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    expenses = db.relationship(
+        "Expense",
+        backref=db.backref("user", lazy="raise"),
+        lazy="raise",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
 
 class Category(db.Model):
@@ -25,10 +43,26 @@ class Category(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-
-    budgets = db.relationship("Budget", backref="category", lazy=True)
-    expenses = db.relationship("Expense", backref="category", lazy=True)
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("user.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+
+    budgets = db.relationship(
+        "Budget",
+        backref=db.backref("category", lazy="raise"),
+        lazy="raise",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+    expenses = db.relationship(
+        "Expense",
+        backref=db.backref("category", lazy="raise"),
+        lazy="raise",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
 
 class Budget(db.Model):
@@ -40,9 +74,24 @@ class Budget(db.Model):
     one of the extra credit requirements.
     """
 
+    __table_args__ = (
+        db.Index("ix_budget_user_month", "user_id", "month"),
+        db.UniqueConstraint(
+            "user_id", "category_id", "month", name="uq_budget_user_cat_month"
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey("category.id"), nullable=False)
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("user.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    category_id = db.Column(
+        db.Integer,
+        db.ForeignKey("category.id", ondelete="CASCADE"),
+        nullable=False,
+    )
     month = db.Column(db.Date, nullable=False, default=date.today)
     amount = db.Column(db.Float, nullable=False)
 
@@ -54,11 +103,45 @@ class Expense(db.Model):
     Each expense belongs to a user and a category and is booked on a date.
     """
 
+    __table_args__ = (
+        db.Index("ix_expense_user_date", "user_id", "date"),
+        db.Index("ix_expense_user_cat_date", "user_id", "category_id", "date"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey("category.id"), nullable=False)
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("user.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    category_id = db.Column(
+        db.Integer,
+        db.ForeignKey("category.id", ondelete="CASCADE"),
+        nullable=False,
+    )
     date = db.Column(db.Date, nullable=False, default=date.today)
     amount = db.Column(db.Float, nullable=False)
     description = db.Column(db.String(255), nullable=True)
 
 
+class MonthlySpend(db.Model):
+    """
+    Running total of expenses per user, category and month.
+
+    Like `Budget.month`, the `month` field stores the first day of the
+    month. Rows are kept up to date when expenses are recorded, so
+    reports read the totals directly instead of summing every expense.
+    """
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("user.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    category_id = db.Column(
+        db.Integer,
+        db.ForeignKey("category.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    month = db.Column(db.Date, primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0.0)
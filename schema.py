@@ -0,0 +1,168 @@
+from sqlalchemy import event
+
+from extensions import db
+
+# Version of the SQLite schema, stored in the database's PRAGMA user_version.
+# Files below this version predate the cascading foreign keys, indexes and
+# unique constraints in models.py and are rebuilt by init_schema().
+SCHEMA_VERSION = 1
+
+# Tables rebuilt by the SQLite upgrade, parents before children.
+_UPGRADED_TABLES = ("user", "category", "budget", "expense")
+
+# SQL expressions truncating a date column to the first day of its month.
+_MONTH_START = {
+    "postgresql": lambda column: db.cast(db.func.date_trunc("month", column), db.Date),
+    "sqlite": lambda column: db.func.date(column, "start of month"),
+}
+
+
+def configure_sqlite_engine(engine) -> None:
+
+    event.listen(engine, "connect", _configure_sqlite_connection)
+
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    # SQLite ignores ON DELETE CASCADE unless foreign keys are switched on
+    # for each connection. create_app() refuses to serve a file init-db has
+    # not upgraded, so every connection that deletes a user enforces them.
+    # WAL lets report and listing reads run while an expense is being
+    # written instead of waiting on the writer's lock.
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def schema_is_current() -> bool:
+
+    with db.engine.connect() as connection:
+        if db.engine.dialect.name == "sqlite":
+            version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+            return version >= SCHEMA_VERSION
+        inspector = db.inspect(connection)
+        tables = set(db.metadata.tables)
+        if not tables <= set(inspector.get_table_names()):
+            return False
+        return _has_current_constraints(inspector, tables)
+
+
+def _has_current_constraints(inspector, tables: set) -> bool:
+    # PostgreSQL has no schema version to read, so look for what the old
+    # create_all() left out: ON DELETE CASCADE on every foreign key and the
+    # unique constraint behind the budget upsert.
+    if "budget" in tables:
+        constraints = inspector.get_unique_constraints("budget")
+        if "uq_budget_user_cat_month" not in {c["name"] for c in constraints}:
+            return False
+    return all(
+        (foreign_key["options"].get("ondelete") or "").upper() == "CASCADE"
+        for name in tables
+        for foreign_key in inspector.get_foreign_keys(name)
+    )
+
+
+def init_schema() -> None:
+
+    engine = db.engine
+    is_sqlite = engine.dialect.name == "sqlite"
+    inspector = db.inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    if not is_sqlite and not _has_current_constraints(
+        inspector, existing_tables & set(db.metadata.tables)
+    ):
+        raise RuntimeError(
+            "This database was created by an older version of the app. "
+            "init-db only upgrades SQLite files; recreate the PostgreSQL "
+            "database or add ON DELETE CASCADE and uq_budget_user_cat_month "
+            "by hand."
+        )
+
+    if is_sqlite and existing_tables:
+        with engine.connect() as connection:
+            version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+        if version < SCHEMA_VERSION:
+            _upgrade_sqlite_schema(existing_tables)
+            existing_tables.discard("monthly_spend")
+
+    db.create_all()
+
+    if "monthly_spend" not in existing_tables:
+        backfill_monthly_spend()
+
+    if is_sqlite:
+        with engine.begin() as connection:
+            connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def _upgrade_sqlite_schema(existing_tables: set) -> None:
+    # SQLite cannot add ON DELETE clauses or constraints to an existing
+    # table, so each table is renamed aside, recreated from the models and
+    # refilled. monthly_spend is dropped and backfilled from the expenses.
+    tables = [name for name in _UPGRADED_TABLES if name in existing_tables]
+
+    with db.engine.connect() as connection:
+        # Both pragmas must be set outside the transaction. legacy_alter_table
+        # stops RENAME from rewriting the other tables' foreign keys to point
+        # at the renamed copy.
+        connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        connection.exec_driver_sql("PRAGMA legacy_alter_table=ON")
+        inspector = db.inspect(connection)
+        old_columns = {
+            name: {column["name"] for column in inspector.get_columns(name)}
+            for name in tables
+        }
+        indexes = [
+            index["name"]
+            for name in tables
+            for index in inspector.get_indexes(name)
+        ]
+
+        connection.exec_driver_sql("BEGIN")
+        for index in indexes:
+            connection.exec_driver_sql(f'DROP INDEX "{index}"')
+        for name in tables:
+            connection.exec_driver_sql(f'ALTER TABLE "{name}" RENAME TO "_old_{name}"')
+        if "monthly_spend" in existing_tables:
+            connection.exec_driver_sql('DROP TABLE "monthly_spend"')
+
+        db.metadata.create_all(connection)
+
+        for name in tables:
+            columns = ", ".join(
+                f'"{column.name}"'
+                for column in db.metadata.tables[name].columns
+                if column.name in old_columns[name]
+            )
+            query = f'SELECT {columns} FROM "_old_{name}"'
+            if name == "budget":
+                # The new unique constraint allows one budget per category and
+                # month; keep the most recently created one.
+                query += (
+                    ' WHERE id IN (SELECT MAX(id) FROM "_old_budget"'
+                    " GROUP BY user_id, category_id, month)"
+                )
+            connection.exec_driver_sql(f'INSERT INTO "{name}" ({columns}) {query}')
+            connection.exec_driver_sql(f'DROP TABLE "_old_{name}"')
+        connection.commit()
+
+        connection.exec_driver_sql("PRAGMA legacy_alter_table=OFF")
+        connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+
+
+def backfill_monthly_spend() -> None:
+
+    from models import Expense, MonthlySpend
+
+    month = _MONTH_START[db.engine.dialect.name](Expense.date)
+    totals_by_month = db.select(
+        Expense.user_id, Expense.category_id, month, db.func.sum(Expense.amount)
+    ).group_by(Expense.user_id, Expense.category_id, month)
+    db.session.execute(
+        db.insert(MonthlySpend).from_select(
+            ["user_id", "category_id", "month", "total"], totals_by_month
+        )
+    )
+    db.session.commit()